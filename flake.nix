@@ -58,7 +58,10 @@
                   service-bin = "${pkgs-with-app.text-extraction}/bin/text-extraction";
                   service-port = 8080;
                   openapi-domain = "/openapi.json";
-                  skip-endpoints = [ "/from-url" ];
+                  skip-endpoints = [
+                    "/from-url"
+                    "/from-urls"
+                  ];
                 }
               );
             }
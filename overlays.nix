@@ -11,12 +11,14 @@ rec {
         (python-final: python-prev: {
           # the version of pyrate-limiter in nixpkgs is a bit too old
           pyrate-limiter = python-prev.pyrate-limiter.overrideAttrs (oldAttrs: rec {
-            version = "3.6.0";
+            # 3.7 is needed to dispose of the buckets of rarely accessed domains
+            version = "3.7.1";
             # the name does not properly update by just changing the version
             name = "${oldAttrs.pname}-${version}";
-            src = oldAttrs.src.override {
-              rev = "refs/tags/v${version}";
-              hash = "sha256-I/wgHVm3QMgt5KEEJnjMj0eH7LTIlNxifKnHqfH4VzA=";
+            src = python-final.fetchPypi {
+              pname = "pyrate_limiter";
+              inherit version;
+              hash = "sha256-smjMCyyfhRddv+Sc52VlmkHbJNFl2kU5WFNgLlz4WBk=";
             };
           });
         })
@@ -12,6 +12,12 @@
   py3langid,
   playwright,
   pyrate-limiter,
+  httpx,
+  h2,
+  orjson,
+  uvloop,
+  httptools,
+  unittestCheckHook,
 }:
 
 buildPythonPackage {
@@ -25,6 +31,7 @@ buildPythonPackage {
     root = ./.;
     include = [
       "text_extraction"
+      "tests"
       ./setup.py
       ./requirements.txt
     ];
@@ -42,8 +49,12 @@ buildPythonPackage {
     py3langid
     playwright
     pyrate-limiter
+    httpx
+    h2
+    orjson
+    uvloop
+    httptools
   ];
 
-  # this package has no tests
-  doCheck = false;
+  nativeCheckInputs = [ unittestCheckHook ];
 }
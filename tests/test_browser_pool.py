@@ -0,0 +1,220 @@
+import asyncio
+import unittest
+from typing import Optional
+
+from text_extraction.browser_pool import ContextPool, RemoteBrowsers
+
+
+class FakePage:
+    async def __aenter__(self) -> "FakePage":
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        pass
+
+
+class FakeContext:
+    def __init__(self) -> None:
+        self.closed = False
+
+    async def new_page(self) -> FakePage:
+        return FakePage()
+
+    async def close(self) -> None:
+        self.closed = True
+
+
+class FakeBrowser:
+    """A browser whose contexts take ``delay`` seconds to create."""
+
+    def __init__(self, delay: float = 0.0, fail: bool = False) -> None:
+        self.delay = delay
+        self.fail = fail
+        self.contexts: list[FakeContext] = []
+
+    async def new_context(self) -> FakeContext:
+        await asyncio.sleep(self.delay)
+        if self.fail:
+            raise RuntimeError("the browser is gone")
+
+        context = FakeContext()
+        self.contexts.append(context)
+        return context
+
+
+async def open_page(pool: ContextPool, browser: FakeBrowser, name: str) -> None:
+    async with pool.new_page(browser, name):  # type: ignore
+        await asyncio.sleep(0)
+
+
+class TestContextPool(unittest.IsolatedAsyncioTestCase):
+    async def test_shares_context_per_name(self):
+        pool = ContextPool()
+        browser = FakeBrowser()
+        await asyncio.gather(*(open_page(pool, browser, "a") for _ in range(3)))
+        await open_page(pool, browser, "b")
+
+        self.assertEqual(len(browser.contexts), 2)
+
+    async def test_replaces_context_after_max_uses(self):
+        pool = ContextPool(max_uses=2)
+        browser = FakeBrowser()
+        for _ in range(3):
+            await open_page(pool, browser, "a")
+
+        self.assertEqual(len(browser.contexts), 2)
+        self.assertTrue(browser.contexts[0].closed)
+        self.assertFalse(browser.contexts[1].closed)
+
+    async def test_isolates_pages_with_single_use(self):
+        pool = ContextPool(max_uses=1)
+        browser = FakeBrowser()
+        await asyncio.gather(*(open_page(pool, browser, "a") for _ in range(3)))
+
+        self.assertEqual(len(browser.contexts), 3)
+        self.assertTrue(all(context.closed for context in browser.contexts))
+
+    async def test_slow_browser_does_not_block_others(self):
+        pool = ContextPool()
+        slow = asyncio.ensure_future(open_page(pool, FakeBrowser(delay=10), "a"))
+        await asyncio.sleep(0)
+
+        async with asyncio.timeout(1):
+            await open_page(pool, FakeBrowser(), "a")
+
+        slow.cancel()
+
+    async def test_retries_failed_creation(self):
+        pool = ContextPool()
+        browser = FakeBrowser(fail=True)
+        with self.assertRaises(RuntimeError):
+            await open_page(pool, browser, "a")
+
+        browser.fail = False
+        await open_page(pool, browser, "a")
+        self.assertEqual(len(browser.contexts), 1)
+
+
+class FakeRemoteBrowser:
+    def __init__(self, location: str) -> None:
+        self.location = location
+        self.connected = True
+        self.handlers: list = []
+
+    def is_connected(self) -> bool:
+        return self.connected
+
+    def on(self, event: str, handler) -> None:
+        self.handlers.append(handler)
+
+    async def close(self) -> None:
+        self.connected = False
+        for handler in self.handlers:
+            handler(self)
+
+
+class FakeConnector:
+    """Connects to the given locations, taking ``delays`` seconds for each."""
+
+    def __init__(self, delays: Optional[dict[str, float]] = None) -> None:
+        self.delays = delays or {}
+        self.failing: set[str] = set()
+        self.browsers: list[FakeRemoteBrowser] = []
+
+    async def __call__(self, location: str) -> FakeRemoteBrowser:
+        await asyncio.sleep(self.delays.get(location, 0.0))
+        if location in self.failing:
+            raise RuntimeError(f"could not connect to {location}")
+
+        browser = FakeRemoteBrowser(location)
+        self.browsers.append(browser)
+        return browser
+
+
+async def use_browser(
+    browsers: RemoteBrowsers, location: str, hold: float = 0.0
+) -> FakeRemoteBrowser:
+    async with browsers.browser(location) as browser:
+        await asyncio.sleep(hold)
+        return browser  # type: ignore
+
+
+class TestRemoteBrowsers(unittest.IsolatedAsyncioTestCase):
+    async def test_shares_connection_per_location(self):
+        connect = FakeConnector({"a": 0.01})
+        browsers = RemoteBrowsers(connect)  # type: ignore
+        results = await asyncio.gather(*(use_browser(browsers, "a") for _ in range(3)))
+        await use_browser(browsers, "a")
+
+        self.assertEqual(len(connect.browsers), 1)
+        self.assertTrue(all(result is connect.browsers[0] for result in results))
+
+    async def test_slow_location_does_not_block_others(self):
+        browsers = RemoteBrowsers(FakeConnector({"slow": 10}))  # type: ignore
+        slow = asyncio.ensure_future(use_browser(browsers, "slow"))
+        await asyncio.sleep(0)
+
+        async with asyncio.timeout(1):
+            await use_browser(browsers, "fast")
+
+        slow.cancel()
+
+    async def test_closes_least_recently_used(self):
+        connect = FakeConnector()
+        browsers = RemoteBrowsers(connect, max_size=2)  # type: ignore
+        for location in ["a", "b", "a", "c"]:
+            await use_browser(browsers, location)
+
+        self.assertEqual(list(browsers.browsers), ["a", "c"])
+        closed = [
+            browser.location for browser in connect.browsers if not browser.connected
+        ]
+        self.assertEqual(closed, ["b"])
+
+    async def test_keeps_evicted_connection_until_done(self):
+        connect = FakeConnector()
+        browsers = RemoteBrowsers(connect, max_size=1)  # type: ignore
+        held = asyncio.ensure_future(use_browser(browsers, "a", hold=0.05))
+        await asyncio.sleep(0.01)
+        await use_browser(browsers, "b")
+
+        first = connect.browsers[0]
+        self.assertTrue(first.connected)
+        await held
+        self.assertFalse(first.connected)
+
+    async def test_reconnects_after_failure(self):
+        connect = FakeConnector()
+        connect.failing.add("a")
+        browsers = RemoteBrowsers(connect)  # type: ignore
+        with self.assertRaises(RuntimeError):
+            await use_browser(browsers, "a")
+        self.assertEqual(list(browsers.browsers), [])
+
+        connect.failing.clear()
+        await use_browser(browsers, "a")
+        self.assertEqual(len(connect.browsers), 1)
+
+    async def test_reconnects_after_disconnect(self):
+        connect = FakeConnector()
+        browsers = RemoteBrowsers(connect)  # type: ignore
+        first = await use_browser(browsers, "a")
+        await first.close()
+        self.assertEqual(list(browsers.browsers), [])
+
+        second = await use_browser(browsers, "a")
+        self.assertIsNot(first, second)
+
+    async def test_close(self):
+        connect = FakeConnector()
+        browsers = RemoteBrowsers(connect)  # type: ignore
+        for location in ["a", "b"]:
+            await use_browser(browsers, location)
+        await browsers.close()
+
+        self.assertFalse(any(browser.connected for browser in connect.browsers))
+        self.assertEqual(list(browsers.browsers), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,142 @@
+import asyncio
+import time
+import unittest
+from unittest import mock
+
+from text_extraction.caching import ContentCache, cached
+
+
+class TestContentCache(unittest.TestCase):
+    def test_evicts_least_recently_used(self):
+        cache: ContentCache[str] = ContentCache(max_size=2, num_shards=1)
+        cache.put("a", "1")
+        cache.put("b", "2")
+        cache.get("a")
+        cache.put("c", "3")
+
+        self.assertEqual(cache.get("a"), "1")
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.get("c"), "3")
+
+    def test_expires_entries(self):
+        cache: ContentCache[str] = ContentCache(ttl=10.0)
+        cache.put("a", "1")
+        self.assertEqual(cache.get("a"), "1")
+
+        now = time.monotonic()
+        with mock.patch("time.monotonic", return_value=now + 11.0):
+            self.assertIsNone(cache.get("a"))
+
+
+class SlowFunction:
+    """Returns its argument after ``delay`` seconds, recording its calls."""
+
+    def __init__(self, delay: float = 0.0) -> None:
+        self.delay = delay
+        self.calls = 0
+        self.cancelled = 0
+
+    async def __call__(self, value):
+        self.calls += 1
+        try:
+            await asyncio.sleep(self.delay)
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+
+        if isinstance(value, BaseException):
+            raise value
+
+        return value
+
+
+def identity(value):
+    return value
+
+
+class TestCached(unittest.IsolatedAsyncioTestCase):
+    async def test_caches_results(self):
+        func = SlowFunction()
+        wrapper = cached(ContentCache(), identity)(func)
+
+        self.assertEqual(await wrapper("a"), "a")
+        self.assertEqual(await wrapper("a"), "a")
+        self.assertEqual(func.calls, 1)
+
+    async def test_does_not_cache_none(self):
+        func = SlowFunction()
+        wrapper = cached(ContentCache(), identity)(func)
+
+        self.assertIsNone(await wrapper(None))
+        self.assertIsNone(await wrapper(None))
+        self.assertEqual(func.calls, 2)
+
+    async def test_coalesces_concurrent_calls(self):
+        func = SlowFunction(delay=0.01)
+        wrapper = cached(ContentCache(), identity)(func)
+
+        results = await asyncio.gather(*(wrapper("a") for _ in range(5)))
+        self.assertEqual(results, ["a"] * 5)
+        self.assertEqual(func.calls, 1)
+
+    async def test_shares_exceptions(self):
+        func = SlowFunction(delay=0.01)
+        wrapper = cached(ContentCache(), identity)(func)
+
+        error = ValueError("no text")
+        results = await asyncio.gather(
+            *(wrapper(error) for _ in range(3)), return_exceptions=True
+        )
+        self.assertEqual(results, [error] * 3)
+        self.assertEqual(func.calls, 1)
+
+        # failures are not cached
+        with self.assertRaises(ValueError):
+            await wrapper(error)
+        self.assertEqual(func.calls, 2)
+
+    async def test_cancelling_one_caller_keeps_the_call(self):
+        func = SlowFunction(delay=0.05)
+        wrapper = cached(ContentCache(), identity)(func)
+
+        first = asyncio.ensure_future(wrapper("a"))
+        second = asyncio.ensure_future(wrapper("a"))
+        await asyncio.sleep(0)
+        first.cancel()
+
+        self.assertEqual(await second, "a")
+        self.assertTrue(first.cancelled())
+        self.assertEqual((func.calls, func.cancelled), (1, 0))
+
+    async def test_cancelling_all_callers_cancels_the_call(self):
+        func = SlowFunction(delay=10)
+        wrapper = cached(ContentCache(), identity)(func)
+
+        callers = [asyncio.ensure_future(wrapper("a")) for _ in range(2)]
+        await asyncio.sleep(0)
+        for caller in callers:
+            caller.cancel()
+        await asyncio.gather(*callers, return_exceptions=True)
+        await asyncio.sleep(0)
+
+        self.assertEqual(func.cancelled, 1)
+
+        # a later caller starts over, instead of waiting on the cancelled call
+        func.delay = 0
+        self.assertEqual(await wrapper("a"), "a")
+        self.assertEqual(func.calls, 2)
+
+    async def test_timeout_cancels_the_call(self):
+        func = SlowFunction(delay=10)
+        wrapper = cached(ContentCache(), identity)(func)
+
+        with self.assertRaises(TimeoutError):
+            async with asyncio.timeout(0.01):
+                await wrapper("a")
+        await asyncio.sleep(0)
+
+        self.assertEqual(func.cancelled, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,76 @@
+import asyncio
+import time
+import unittest
+
+from pyrate_limiter import BucketFullException
+
+from text_extraction.rate_limiting import (
+    DomainSemaphores,
+    as_waiting_decorator,
+    domain_mapper,
+    get_simple_multibucket_limiter,
+)
+
+
+async def access(url: str) -> str:
+    return url
+
+
+class TestWaitingDecorator(unittest.IsolatedAsyncioTestCase):
+    async def test_waits_for_the_rate_limits(self):
+        limiter = get_simple_multibucket_limiter(max_rate_per_second=5, base_weight=1)
+        limited = as_waiting_decorator(limiter, max_delay=10.0)(domain_mapper)(access)
+
+        start = time.monotonic()
+        urls = [f"http://example.org/{i}" for i in range(12)]
+        self.assertEqual(await asyncio.gather(*map(limited, urls)), urls)
+        # the accesses beyond the first five per second had to wait
+        self.assertGreater(time.monotonic() - start, 1.0)
+
+    async def test_fails_beyond_max_delay(self):
+        limiter = get_simple_multibucket_limiter(max_rate_per_second=5, base_weight=1)
+        limited = as_waiting_decorator(limiter, max_delay=0.1)(domain_mapper)(access)
+
+        start = time.monotonic()
+        results = await asyncio.gather(
+            *(limited(f"http://example.org/{i}") for i in range(7)),
+            return_exceptions=True,
+        )
+        failures = [result for result in results if isinstance(result, Exception)]
+        self.assertEqual(len(failures), 2)
+        self.assertTrue(all(isinstance(e, BucketFullException) for e in failures))
+        # without waiting for them first
+        self.assertLess(time.monotonic() - start, 0.5)
+
+    async def test_limits_domains_separately(self):
+        limiter = get_simple_multibucket_limiter(max_rate_per_second=5, base_weight=1)
+        limited = as_waiting_decorator(limiter, max_delay=0.1)(domain_mapper)(access)
+
+        urls = [f"http://{host}.org/" for host in "abcdefg"]
+        self.assertEqual(await asyncio.gather(*map(limited, urls)), urls)
+
+
+class TestDomainSemaphores(unittest.IsolatedAsyncioTestCase):
+    async def test_bounds_concurrency_per_domain(self):
+        semaphores = DomainSemaphores(max_concurrency=2)
+        running = {"a.org": 0, "b.org": 0}
+        most = dict(running)
+
+        @semaphores.as_decorator()(domain_mapper)
+        async def limited(url: str) -> None:
+            host = url.split("/")[2]
+            running[host] += 1
+            most[host] = max(most[host], running[host])
+            await asyncio.sleep(0.01)
+            running[host] -= 1
+
+        await asyncio.gather(
+            *(limited(f"http://{host}/") for host in ["a.org", "b.org"] * 4)
+        )
+        self.assertEqual(most, {"a.org": 2, "b.org": 2})
+        # and forgets about the domains once they are no longer accessed
+        self.assertEqual(semaphores.semaphores, {})
+
+
+if __name__ == "__main__":
+    unittest.main()
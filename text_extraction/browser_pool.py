@@ -0,0 +1,307 @@
+import asyncio
+import time
+from collections import OrderedDict
+from collections.abc import AsyncIterator, Awaitable, Callable
+from contextlib import asynccontextmanager, suppress
+from dataclasses import dataclass, field
+from typing import Optional
+
+from playwright import async_api
+
+
+@dataclass
+class _PooledContext:
+    #: creates the context, such that concurrent users share one attempt
+    creation: asyncio.Task[async_api.BrowserContext]
+    #: the number of pages that are currently open in this context
+    in_use: int = 0
+    #: the number of pages that have been opened in this context in total
+    uses: int = 0
+    #: whether the context is to be closed as soon as it is no longer in use
+    retired: bool = False
+    last_used: float = field(default_factory=time.monotonic)
+
+
+class ContextPool:
+    """
+    Re-use one ``BrowserContext`` per browser and (domain) name.
+
+    Opening a new context for every page discards Chromium's caches and open
+    connections. By sharing a context between all accesses to the same
+    domain, later accesses can make use of them. This also means that these
+    accesses share cookies and storage, even if they come from unrelated
+    callers. A pool with ``max_uses=1`` opens a fresh context for every page
+    instead, isolating them from each other.
+
+    Contexts that have not been used for ``max_idle_time`` seconds are
+    closed, such that rarely accessed domains do not keep their contexts
+    alive indefinitely. Contexts that have served ``max_uses`` pages are
+    replaced by fresh ones, bounding the memory that accumulates in them.
+    Creating a context for one browser and name does not hold up the others.
+    """
+
+    def __init__(self, max_idle_time: float = 300.0, max_uses: int = 100) -> None:
+        self.max_idle_time = max_idle_time
+        self.max_uses = max_uses
+        self.contexts: dict[tuple[async_api.Browser, str], _PooledContext] = dict()
+
+    async def _close(self, pooled: _PooledContext) -> None:
+        creation = pooled.creation
+        if not creation.done():
+            creation.cancel()
+        elif not creation.cancelled() and creation.exception() is None:
+            # the context may already be gone, e.g. with its browser
+            with suppress(async_api.Error):
+                await creation.result().close()
+
+    def _retire(self, key: tuple[async_api.Browser, str]) -> list[_PooledContext]:
+        # contexts that still have open pages are closed once those are done
+        pooled = self.contexts.pop(key)
+        pooled.retired = True
+        return [pooled] if pooled.in_use == 0 else []
+
+    def _evict_idle(self) -> list[_PooledContext]:
+        now = time.monotonic()
+        # this also cleans up the contexts of browsers that have been closed
+        idle = [
+            key
+            for key, pooled in self.contexts.items()
+            if pooled.in_use == 0 and now - pooled.last_used > self.max_idle_time
+        ]
+        return [closed for key in idle for closed in self._retire(key)]
+
+    @staticmethod
+    def _has_failed(pooled: _PooledContext) -> bool:
+        creation = pooled.creation
+        return creation.done() and (
+            creation.cancelled() or creation.exception() is not None
+        )
+
+    async def _acquire(self, browser: async_api.Browser, name: str) -> _PooledContext:
+        # the pool is only changed between awaits, so it needs no lock
+        closed = self._evict_idle()
+
+        key = (browser, name)
+        pooled = self.contexts.get(key)
+        if pooled is not None and (
+            pooled.uses >= self.max_uses or self._has_failed(pooled)
+        ):
+            closed += self._retire(key)
+            pooled = None
+
+        if pooled is None:
+            pooled = _PooledContext(asyncio.ensure_future(browser.new_context()))
+            self.contexts[key] = pooled
+
+        pooled.in_use += 1
+        pooled.uses += 1
+
+        for retired in closed:
+            await self._close(retired)
+
+        return pooled
+
+    @asynccontextmanager
+    async def new_page(
+        self, browser: async_api.Browser, name: str
+    ) -> AsyncIterator[async_api.Page]:
+        """
+        Open a new page in the context that belongs to the given name, and
+        close it again once we are done.
+        """
+        pooled = await self._acquire(browser, name)
+        try:
+            # a cancelled user must not cancel the creation for everyone else
+            context = await asyncio.shield(pooled.creation)
+            async with await context.new_page() as page:
+                yield page
+        finally:
+            pooled.in_use -= 1
+            pooled.last_used = time.monotonic()
+            # do not keep used up contexts around until the next access
+            key = (browser, name)
+            if pooled.uses >= self.max_uses and self.contexts.get(key) is pooled:
+                self._retire(key)
+            if pooled.retired and pooled.in_use == 0:
+                await self._close(pooled)
+
+
+@dataclass
+class _PooledBrowser:
+    browser: Optional[async_api.Browser] = None
+    #: the number of times the browser has been handed out since its launch
+    uses: int = 0
+
+
+class BrowserPool:
+    """
+    Share a fixed number of local browsers between all requests.
+
+    Each browser is only handed out to one user at a time, which bounds the
+    number of pages that are rendered at once. Browsers are launched once
+    they are first needed, relaunched if they have crashed, and replaced by
+    fresh ones after being handed out ``recycle_after`` times, as Chromium
+    slowly accumulates memory over its lifetime.
+
+    :param launch: Launches a new browser.
+    """
+
+    def __init__(
+        self,
+        launch: Callable[[], Awaitable[async_api.Browser]],
+        size: int = 4,
+        recycle_after: int = 100,
+    ) -> None:
+        self.launch = launch
+        self.recycle_after = recycle_after
+        self.slots = [_PooledBrowser() for _ in range(size)]
+        self.queue: asyncio.Queue[_PooledBrowser] = asyncio.Queue()
+        for slot in self.slots:
+            self.queue.put_nowait(slot)
+
+    async def _close(self, slot: _PooledBrowser) -> None:
+        if slot.browser is not None:
+            with suppress(async_api.Error):
+                await slot.browser.close()
+            slot.browser = None
+
+    @asynccontextmanager
+    async def browser(self) -> AsyncIterator[async_api.Browser]:
+        """Wait for one of the browsers and hand it back once we are done."""
+        slot = await self.queue.get()
+        try:
+            if (
+                slot.browser is None
+                or not slot.browser.is_connected()
+                or slot.uses >= self.recycle_after
+            ):
+                await self._close(slot)
+                slot.browser = await self.launch()
+                slot.uses = 0
+
+            slot.uses += 1
+            yield slot.browser
+        finally:
+            self.queue.put_nowait(slot)
+
+    async def close(self) -> None:
+        """Close all browsers that have been launched."""
+        for slot in self.slots:
+            await self._close(slot)
+
+
+@dataclass
+class _RemoteBrowser:
+    #: connects to the browser, such that concurrent users share one attempt
+    connection: asyncio.Task[async_api.Browser]
+    #: the number of users that are currently using this browser
+    in_use: int = 0
+    #: whether the connection is to be closed as soon as it is no longer in use
+    retired: bool = False
+
+
+class RemoteBrowsers:
+    """
+    Keep the connections to remote browsers open, by their cdp locations.
+
+    As the locations are chosen by the clients, at most ``max_size``
+    connections are kept; the least recently used ones are closed to make room
+    for new ones. Connecting to one location does not hold up the others.
+
+    :param connect: Connects to the browser at the given cdp location.
+    """
+
+    def __init__(
+        self,
+        connect: Callable[[str], Awaitable[async_api.Browser]],
+        max_size: int = 16,
+    ) -> None:
+        self.connect = connect
+        self.max_size = max_size
+        self.browsers: OrderedDict[str, _RemoteBrowser] = OrderedDict()
+
+    def _forget(self, location: str, connection: Optional[asyncio.Task]) -> None:
+        # we may already have reconnected in the meantime
+        remote = self.browsers.get(location)
+        if remote is not None and remote.connection is connection:
+            del self.browsers[location]
+
+    async def _connect(self, location: str) -> async_api.Browser:
+        connection = asyncio.current_task()
+        try:
+            browser = await self.connect(location)
+        except BaseException:
+            # try again on the next use, instead of keeping the failure around
+            self._forget(location, connection)
+            raise
+
+        browser.on("disconnected", lambda _: self._forget(location, connection))
+        return browser
+
+    @staticmethod
+    def _is_usable(remote: _RemoteBrowser) -> bool:
+        connection = remote.connection
+        if not connection.done():
+            return True
+
+        return (
+            not connection.cancelled()
+            and connection.exception() is None
+            and connection.result().is_connected()
+        )
+
+    async def _close(self, remote: _RemoteBrowser) -> None:
+        connection = remote.connection
+        if not connection.done():
+            connection.cancel()
+        elif not connection.cancelled() and connection.exception() is None:
+            # the browser may already be gone
+            with suppress(async_api.Error):
+                await connection.result().close()
+
+    async def _acquire(self, location: str) -> _RemoteBrowser:
+        remote = self.browsers.get(location)
+        if remote is not None and not self._is_usable(remote):
+            del self.browsers[location]
+            remote = None
+
+        if remote is None:
+            remote = _RemoteBrowser(asyncio.ensure_future(self._connect(location)))
+            self.browsers[location] = remote
+        else:
+            self.browsers.move_to_end(location)
+
+        remote.in_use += 1
+
+        evicted = []
+        while len(self.browsers) > self.max_size:
+            _, oldest = self.browsers.popitem(last=False)
+            oldest.retired = True
+            if oldest.in_use == 0:
+                evicted.append(oldest)
+        for oldest in evicted:
+            await self._close(oldest)
+
+        return remote
+
+    @asynccontextmanager
+    async def browser(self, location: str) -> AsyncIterator[async_api.Browser]:
+        """
+        Return the connection to the browser at the given cdp location,
+        connecting to it if necessary, and keep it open once we are done.
+        """
+        remote = await self._acquire(location)
+        try:
+            # a cancelled user must not cancel the connection for everyone else
+            yield await asyncio.shield(remote.connection)
+        finally:
+            remote.in_use -= 1
+            if remote.retired and remote.in_use == 0:
+                await self._close(remote)
+
+    async def close(self) -> None:
+        """Close all connections."""
+        remotes = list(self.browsers.values())
+        self.browsers.clear()
+        for remote in remotes:
+            await self._close(remote)
@@ -0,0 +1,143 @@
+import asyncio
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import Callable, Hashable
+from functools import partial, wraps
+from inspect import isawaitable
+from typing import Any, Generic, Optional, TypeVar
+
+V = TypeVar("V")
+
+#: A key mapper assigns the key under which the result of a call is cached to
+#: the arguments of that call, similarly to how the rate limiter's mapping
+#: assigns (domain) names to them.
+KeyMapper = Callable[..., Hashable]
+
+
+class ContentCache(Generic[V]):
+    """
+    A thread-safe least-recently-used cache.
+
+    The entries are distributed over several shards, each of which is guarded
+    by its own lock, such that concurrent accesses rarely have to wait on each
+    other. Each shard evicts its least recently used entries individually.
+
+    If ``ttl`` is given, entries additionally expire that many seconds after
+    they were cached.
+    """
+
+    def __init__(
+        self, max_size: int = 1000, num_shards: int = 16, ttl: Optional[float] = None
+    ) -> None:
+        self.num_shards = num_shards
+        self.shard_size = max(1, max_size // num_shards)
+        self.ttl = ttl
+        # each value is stored together with the time at which it expires
+        self.shards: list[OrderedDict[Hashable, tuple[V, float]]] = [
+            OrderedDict() for _ in range(num_shards)
+        ]
+        self.locks = [threading.Lock() for _ in range(num_shards)]
+
+    def _shard_index(self, key: Hashable) -> int:
+        return hash(key) % self.num_shards
+
+    def get(self, key: Hashable) -> Optional[V]:
+        """Return the value cached under the given key, if there is one."""
+        index = self._shard_index(key)
+        with self.locks[index]:
+            shard = self.shards[index]
+            entry = shard.get(key)
+            if entry is None:
+                return None
+
+            value, expires_at = entry
+            if time.monotonic() >= expires_at:
+                del shard[key]
+                return None
+
+            shard.move_to_end(key)
+
+        return value
+
+    def put(self, key: Hashable, value: V) -> None:
+        """Cache the value, evicting the least recently used one if full."""
+        index = self._shard_index(key)
+        with self.locks[index]:
+            shard = self.shards[index]
+            expires_at = (
+                time.monotonic() + self.ttl if self.ttl is not None else float("inf")
+            )
+            shard[key] = (value, expires_at)
+            shard.move_to_end(key)
+            if len(shard) > self.shard_size:
+                shard.popitem(last=False)
+
+
+def cached(
+    cache: ContentCache, key_mapper: KeyMapper
+) -> Callable[[Callable[..., Any]], Callable[..., Any]]:
+    """
+    Cache the results of an asynchronous function.
+
+    Results of ``None`` are not cached, because they indicate that nothing
+    could be extracted, which may well change on the next attempt.
+
+    Concurrent calls with the same key are coalesced into a single call of the
+    function, whose result (or exception) is shared between all of them. The
+    call is cancelled once all of them have been cancelled.
+
+    :param cache: The cache to look up and store the results in.
+    :param key_mapper: Assigns the cache key to the arguments of each call.
+    """
+
+    def decorator(func: Callable[..., Any]) -> Callable[..., Any]:
+        # the calls that are currently in progress, by their keys
+        in_flight: dict[Hashable, asyncio.Task] = dict()
+        # the number of callers waiting on each of these calls
+        waiters: dict[asyncio.Task, int] = dict()
+
+        def forget(key: Hashable, task: asyncio.Task) -> None:
+            # a cancelled call may already have been replaced by a new one
+            if in_flight.get(key) is task:
+                del in_flight[key]
+
+        async def call(key: Hashable, *args, **kwargs):
+            result = func(*args, **kwargs)
+            while isawaitable(result):
+                result = await result
+
+            if result is not None:
+                cache.put(key, result)
+
+            return result
+
+        @wraps(func)
+        async def wrapper(*args, **kwargs):
+            key = key_mapper(*args, **kwargs)
+            result = cache.get(key)
+            if result is not None:
+                return result
+
+            task = in_flight.get(key)
+            if task is None:
+                task = asyncio.ensure_future(call(key, *args, **kwargs))
+                in_flight[key] = task
+                task.add_done_callback(partial(forget, key))
+
+            waiters[task] = waiters.get(task, 0) + 1
+            try:
+                # a cancelled caller must not cancel the call for everyone else
+                return await asyncio.shield(task)
+            finally:
+                waiters[task] -= 1
+                if not waiters[task]:
+                    del waiters[task]
+                    # but once nobody is waiting anymore, stop the call
+                    if not task.done():
+                        task.cancel()
+                        forget(key, task)
+
+        return wrapper
+
+    return decorator
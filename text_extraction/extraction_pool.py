@@ -0,0 +1,69 @@
+import asyncio
+import multiprocessing
+import os
+import threading
+from collections.abc import Callable
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Optional, TypeVar
+
+T = TypeVar("T")
+
+
+class ExtractionPool:
+    """
+    Run extractions in separate processes, such that they do not compete for
+    the GIL.
+
+    The workers are fresh interpreters rather than forks of the (possibly
+    multi-threaded) caller. They are only started once they are needed, and
+    again after the pool has been closed. If a worker dies (e.g. because it ran
+    out of memory), the processes are replaced.
+    """
+
+    def __init__(self, max_workers: Optional[int] = None) -> None:
+        self.max_workers = max_workers or os.cpu_count()
+        self.executor: Optional[ProcessPoolExecutor] = None
+        self.lock = threading.Lock()
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        with self.lock:
+            if self.executor is None:
+                self.executor = ProcessPoolExecutor(
+                    max_workers=self.max_workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                )
+
+            return self.executor
+
+    def _replace(self, broken: ProcessPoolExecutor) -> None:
+        with self.lock:
+            # concurrent extractions may have replaced it already
+            if self.executor is broken:
+                self.executor = None
+
+        broken.shutdown(wait=False)
+
+    async def run(self, func: Callable[[], T]) -> T:
+        """
+        Run the function in one of the worker processes. If the pool breaks
+        while doing so, retry once in fresh processes.
+        """
+        loop = asyncio.get_running_loop()
+        executor = self._get_executor()
+        try:
+            return await loop.run_in_executor(executor, func)
+        except BrokenProcessPool:
+            self._replace(executor)
+            return await loop.run_in_executor(self._get_executor(), func)
+
+    async def aclose(self) -> None:
+        """
+        Stop the worker processes, cancelling the extractions that have not
+        started yet, without blocking the event loop.
+        """
+        with self.lock:
+            executor, self.executor = self.executor, None
+
+        if executor is not None:
+            await asyncio.to_thread(executor.shutdown, cancel_futures=True)
@@ -1,77 +1,528 @@
-from collections.abc import Awaitable, Callable
+import asyncio
+import hashlib
+import re
+from collections.abc import Awaitable, Callable, Collection, Hashable, Iterable
+from contextlib import AbstractAsyncContextManager, nullcontext, suppress
 from functools import partial
-from typing import Any, Literal, Optional
+from inspect import signature
+from typing import Any, Literal, Optional, get_args
 
+import httpx
 import py3langid as langid
 import trafilatura
 from playwright import async_api
 from trafilatura.settings import use_config
+from trafilatura.utils import decode_file
 
-from text_extraction.rate_limiting import get_simple_multibucket_limiter, domain_mapper
+from text_extraction._version import __version__
+from text_extraction.browser_pool import ContextPool
+from text_extraction.caching import ContentCache, cached
+from text_extraction.extraction_pool import ExtractionPool
+from text_extraction.rate_limiting import (
+    DomainSemaphores,
+    as_waiting_decorator,
+    get_simple_multibucket_limiter,
+    domain_mapper,
+)
 
-# limit per-domain accesses to 5 per second and 50 per minute
-limiter = get_simple_multibucket_limiter(
-    max_rate_per_second=5, base_weight=1
-).as_decorator()(domain_mapper)
+#: limits per-domain accesses to 5 per second and 50 per minute
+rate_limiter = get_simple_multibucket_limiter(max_rate_per_second=5, base_weight=1)
+# accesses beyond that wait for up to a minute, instead of failing right away
+limiter = as_waiting_decorator(rate_limiter, max_delay=60.0)(domain_mapper)
+# in addition, limit the per-domain accesses that are in flight at once to 5
+concurrency_limiter = DomainSemaphores(max_concurrency=5).as_decorator()(domain_mapper)
 Preference = Literal["none", "recall", "precision"]
 
+USER_AGENT = f"text-extraction/{__version__}"
 
-def from_html_unlimited(
-    url: str, target_language: str = "auto", preference: Preference = "none"
+# disable signal, because it causes issues with the web-service and does not
+# work outside of the main thread, in which we do not run the extraction
+_TRAFILATURA_CONFIG = use_config()
+_TRAFILATURA_CONFIG.set("DEFAULT", "EXTRACTION_TIMEOUT", "0")
+
+#: when given an ``ExtractionPool``, documents up to this length are still
+#: extracted in a thread, because sending them to another process would cost
+#: more than it saves
+PROCESS_POOL_THRESHOLD = 32_000
+
+
+#: like trafilatura's own downloads, skip documents that are implausibly small
+#: or too large to be worth (or safe) processing
+MIN_FILE_SIZE = _TRAFILATURA_CONFIG.getint("DEFAULT", "MIN_FILE_SIZE")
+MAX_FILE_SIZE = _TRAFILATURA_CONFIG.getint("DEFAULT", "MAX_FILE_SIZE")
+
+#: responses with these status codes are usually temporary, so retry them
+RETRY_STATUS_CODES = frozenset({429, 500, 502, 503, 504})
+#: the number of times that failed downloads are retried
+DOWNLOAD_RETRIES = 2
+#: the time in seconds that downloading a document may take in total. the
+#: client's timeout only limits each single read, which a slow server may
+#: never exceed while still taking arbitrarily long
+DOWNLOAD_TIMEOUT = 60.0
+
+
+def new_client() -> httpx.AsyncClient:
+    """Create an HTTP client that is configured for downloading web pages."""
+    return httpx.AsyncClient(
+        headers={"User-Agent": USER_AGENT},
+        timeout=httpx.Timeout(30.0),
+        follow_redirects=True,
+        # also retry connections that could not be established
+        transport=httpx.AsyncHTTPTransport(
+            http2=True,
+            limits=httpx.Limits(max_keepalive_connections=64, max_connections=128),
+            retries=DOWNLOAD_RETRIES,
+        ),
+    )
+
+
+# the client that is shared by all downloads, and the event loop it belongs to
+_DEFAULT_CLIENT: Optional[tuple[asyncio.AbstractEventLoop, httpx.AsyncClient]] = None
+
+
+def _default_client() -> httpx.AsyncClient:
+    """
+    Return the client that is shared by all downloads in the running event
+    loop, such that repeated accesses to the same host can re-use open
+    (HTTP/2) connections. A different client can be passed to the functions
+    below instead.
+    """
+    global _DEFAULT_CLIENT
+    # open connections can only be used in the event loop that opened them,
+    # so e.g. each call of asyncio.run needs a new client
+    loop = asyncio.get_running_loop()
+    if _DEFAULT_CLIENT is None or _DEFAULT_CLIENT[0] is not loop:
+        _DEFAULT_CLIENT = loop, new_client()
+
+    return _DEFAULT_CLIENT[1]
+
+
+async def from_html_unlimited(
+    url: str,
+    target_language: str = "auto",
+    preference: Preference = "none",
+    client: Optional[httpx.AsyncClient] = None,
+    pool: Optional[ExtractionPool] = None,
 ) -> Optional[str]:
     """Extract the text from the given URL"""
-    # disable signal, because it causes issues with the web-service
-    newconfig = use_config()
-    newconfig.set("DEFAULT", "EXTRACTION_TIMEOUT", "0")
+    if client is None:
+        client = _default_client()
 
-    downloaded = trafilatura.fetch_response(url, config=newconfig, decode=True)
+    try:
+        async with asyncio.timeout(DOWNLOAD_TIMEOUT):
+            downloaded = await _download(client, url)
+    except TimeoutError:
+        return None
 
     if downloaded is None:
         return None
+    content, _response = downloaded
+    if len(content) < MIN_FILE_SIZE:
+        return None
+
+    # when the server declared the encoding, decode using it. otherwise, leave
+    # guessing it (e.g. from meta tags) to the extraction
+    html: str | bytes = content
+    if _response.charset_encoding:
+        try:
+            html = content.decode(_response.charset_encoding, errors="replace")
+        except LookupError:
+            pass
+
+    return await from_binary_html_async(
+        html,
+        target_language=target_language,
+        preference=preference,
+        content_type=_response.headers.get("Content-Type"),
+        pool=pool,
+    )
+
+
+async def _download(
+    client: httpx.AsyncClient, url: str
+) -> Optional[tuple[bytes, httpx.Response]]:
+    for attempt in range(DOWNLOAD_RETRIES + 1):
+        try:
+            async with client.stream("GET", url) as _response:
+                if _response.is_success:
+                    content = await _read_limited(_response)
+                    return None if content is None else (content, _response)
+        except httpx.HTTPError:
+            return None
+
+        # retry errors that are likely temporary, giving the server some time
+        retryable = _response.status_code in RETRY_STATUS_CODES
+        if not retryable or attempt == DOWNLOAD_RETRIES:
+            return None
+        await asyncio.sleep(0.5 * 2**attempt)
+
+    return None
+
+
+async def _read_limited(response: httpx.Response) -> Optional[bytes]:
+    # stop downloading documents as soon as they turn out to be too large
+    chunks = []
+    size = 0
+    async for chunk in response.aiter_bytes():
+        size += len(chunk)
+        if size > MAX_FILE_SIZE:
+            return None
+        chunks.append(chunk)
+
+    return b"".join(chunks)
+
 
-    return from_binary_html(
-        downloaded, target_language=target_language, preference=preference
+async def from_binary_html_async(
+    html: str | bytes,
+    target_language: str = "auto",
+    preference: Preference = "none",
+    content_type: Optional[str] = None,
+    pool: Optional[ExtractionPool] = None,
+) -> Optional[str]:
+    """
+    Extract the text from the raw html, like ``from_binary_html``, but without
+    blocking the event loop. If a ``pool`` is given, large documents are
+    extracted in its processes, such that multiple extractions can run in
+    parallel. Otherwise, they are extracted in a thread.
+    """
+    if _is_plain_text_content_type(content_type):
+        return _plain_text(html, target_language=target_language)
+
+    # look up the cache here, rather than in the worker processes, as each of
+    # those would only see its own cache
+    key = _document_key(html, target_language=target_language, preference=preference)
+    fulltext = document_cache.get(key)
+    if fulltext is not None:
+        return fulltext
+
+    extract = partial(
+        _extract_text, html, target_language=target_language, preference=preference
     )
+    if pool is None or len(html) <= PROCESS_POOL_THRESHOLD:
+        fulltext = await asyncio.to_thread(extract)
+    else:
+        fulltext = await pool.run(extract)
+
+    if fulltext is not None:
+        document_cache.put(key, fulltext)
+
+    return fulltext
+
+
+def options_mapper(
+    url: str,
+    target_language: str = "auto",
+    preference: Preference = "none",
+    *args,
+    **kwargs,
+) -> Hashable:
+    """Return the URL and the extraction options, as the key to cache under."""
+    return url, target_language, preference
+
+
+#: the texts extracted from the given URLs, such that repeated requests for
+#: the same URL skip both the download and the extraction. the texts expire,
+#: as the pages they were extracted from may change
+html_cache: ContentCache[str] = ContentCache(max_size=1000, num_shards=16, ttl=300.0)
+
+#: like ``from_html``, but always downloads the page again, e.g. for callers
+#: that cache the results themselves
+from_html_uncached = concurrency_limiter(limiter(from_html_unlimited))
+
+# check the cache before the rate limiter, such that hits do not count
+# towards the accesses on the domain
+from_html = cached(html_cache, options_mapper)(from_html_uncached)
+
+
+async def from_urls(
+    urls: Iterable[str],
+    target_language: str = "auto",
+    preference: Preference = "none",
+    max_concurrency: int = 10,
+) -> list[Optional[str] | BaseException]:
+    """
+    Extract the texts from multiple URLs concurrently, using ``from_html``.
+
+    At most ``max_concurrency`` URLs are processed at once; on top of that,
+    the per-domain rate limits of ``from_html`` apply. Instead of raising,
+    the exception of a failed URL is returned in its place.
+    """
+    semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def from_url(url: str) -> Optional[str]:
+        async with semaphore:
+            return await from_html(
+                url, target_language=target_language, preference=preference
+            )
+
+    return await asyncio.gather(*map(from_url, urls), return_exceptions=True)
+
+
+WaitUntil = Literal["commit", "domcontentloaded", "load", "networkidle"]
+
+
+async def default_goto(
+    page: async_api.Page,
+    url: str,
+    wait_until: WaitUntil = "domcontentloaded",
+    timeout: float = 90000,
+    settle_time: float = 500,
+) -> Optional[async_api.Response]:
+    """
+    Navigate to the URL, then give deferred scripts ``settle_time``
+    milliseconds to render their content.
+    """
+    response = await page.goto(url, wait_until=wait_until, timeout=timeout)
+    await page.wait_for_timeout(settle_time)
+    return response
+
+
+#: the browser contexts shared between accesses to the same domain
+browser_contexts = ContextPool(max_idle_time=300.0, max_uses=100)
 
+#: the kinds of resources that do not contribute to the text of a page, and
+#: thus are not loaded by the headless browser.
+#: note that intercepting requests disables the browser's HTTP cache, such that
+#: the scripts of a page are downloaded again on every visit, even within a
+#: shared context. pass an empty collection to keep the cache instead
+BLOCKED_RESOURCE_TYPES = frozenset({"image", "font", "media", "stylesheet"})
 
-from_html = limiter(from_html_unlimited)
+#: the media types of documents that a headless browser renders as web pages
+HTML_CONTENT_TYPES = frozenset({"text/html", "application/xhtml+xml"})
 
-default_goto = partial(async_api.Page.goto, wait_until="load", timeout=90000)
+
+class UnsupportedMediaTypeError(ValueError):
+    """The document is of a media type that no text can be extracted from."""
+
+    def __init__(self, media_type: str) -> None:
+        super().__init__(f"Can not extract text from documents of type {media_type}")
+        self.media_type = media_type
+
+
+async def head_media_type(
+    url: str, timeout: float = 3.0, client: Optional[httpx.AsyncClient] = None
+) -> Optional[str]:
+    """
+    Return the media type that the server declares for the URL, without
+    downloading its content, or ``None`` if it could not be determined.
+    """
+    if client is None:
+        client = _default_client()
+
+    try:
+        _response = await client.head(url, timeout=timeout)
+    except httpx.HTTPError:
+        return None
+
+    # some servers do not support HEAD requests, but may still serve the URL
+    if not _response.is_success:
+        return None
+
+    return _media_type(_response.headers.get("Content-Type"))
+
+
+async def _block_resources(route: async_api.Route, blocked: Collection[str]) -> None:
+    # requests may still arrive while, or after, their page is being closed
+    with suppress(async_api.Error):
+        if route.request.resource_type in blocked:
+            await route.abort()
+        else:
+            await route.continue_()
+
+
+#: lends a browser for as long as it is needed, e.g. from a ``BrowserPool``
+BrowserFactory = Callable[[], AbstractAsyncContextManager[async_api.Browser]]
 
 
 async def from_headless_browser_unlimited(
     url: str,
-    browser: async_api.Browser,
+    browser: async_api.Browser | BrowserFactory,
     target_language: str = "auto",
     preference: Preference = "none",
-    goto_fun: Callable[[async_api.Page, str], Awaitable] = default_goto,
+    goto_fun: Optional[Callable[[async_api.Page, str], Awaitable]] = None,
+    wait_until: WaitUntil = "domcontentloaded",
+    contexts: ContextPool = browser_contexts,
+    blocked_resource_types: Collection[str] = BLOCKED_RESOURCE_TYPES,
+    sniff_content_type: bool = True,
+    client: Optional[httpx.AsyncClient] = None,
+    pool: Optional[ExtractionPool] = None,
 ) -> Optional[str]:
-    # create a new page for this task and close it once we are done
-    async with await browser.new_page() as page:
+    # rendering documents other than web pages is a waste of time. plain text
+    # is downloaded directly instead, anything else can not be extracted from,
+    # which is reported right away
+    if sniff_content_type:
+        media_type = await head_media_type(url, client=client)
+        if media_type in PLAIN_TEXT_CONTENT_TYPES:
+            return await from_html_unlimited(
+                url,
+                target_language=target_language,
+                preference=preference,
+                client=client,
+                pool=pool,
+            )
+        if media_type is not None and media_type not in HTML_CONTENT_TYPES:
+            raise UnsupportedMediaTypeError(media_type)
+
+    # the DOM is usually complete long before all sub-resources are loaded.
+    # for pages that render their text later (e.g. SPAs), use "networkidle"
+    if goto_fun is None:
+        goto_fun = partial(default_goto, wait_until=wait_until)
+
+    # only borrow the browser now, such that requests that still wait for
+    # their rate limits or turn out not to need a browser do not hold it idle
+    browser_manager = (
+        nullcontext(browser) if isinstance(browser, async_api.Browser) else browser()
+    )
+
+    # create a new page for this task and close it once we are done.
+    # the page shares its context with other pages on the same domain
+    domain, _ = domain_mapper(url)
+    async with (
+        browser_manager as _browser,
+        contexts.new_page(_browser, domain) as page,
+    ):
+        if blocked_resource_types:
+            await page.route(
+                "**/*", partial(_block_resources, blocked=blocked_resource_types)
+            )
         await goto_fun(page, url)
         content = await page.content()
 
     if content is None:
         return None
 
-    return from_binary_html(
-        content, target_language=target_language, preference=preference
+    return await from_binary_html_async(
+        content, target_language=target_language, preference=preference, pool=pool
     )
 
 
-from_headless_browser = limiter(from_headless_browser_unlimited)  # type: ignore
+from_headless_browser = concurrency_limiter(
+    limiter(from_headless_browser_unlimited)  # type: ignore
+)
+
+
+# newer versions of trafilatura call no_fallback fast, and deprecate the former
+_FAST_PARAMETER = (
+    "fast" if "fast" in signature(trafilatura.extract).parameters else "no_fallback"
+)
+
+#: trafilatura's extraction, set up once for each preference
+_EXTRACTORS: dict[str, Callable[..., Optional[str]]] = {
+    preference: partial(
+        trafilatura.extract,
+        favor_recall=preference == "recall",
+        favor_precision=preference == "precision",
+        # without any preference, skip the (slow) fall-back algorithms
+        **{_FAST_PARAMETER: preference == "none"},
+    )
+    for preference in get_args(Preference)
+}
+
+
+#: the content types of documents that already are plain text, such that there
+#: is nothing to extract from them
+PLAIN_TEXT_CONTENT_TYPES = frozenset(
+    {"text/plain", "text/markdown", "application/json"}
+)
+
+
+# the media type at the beginning of a Content-Type header, ignoring whitespace
+# and any parameters (e.g. the charset) that follow it
+_CONTENT_TYPE_PATTERN = re.compile(r"\s*([\w.+-]+/[\w.+-]+)")
+
+
+def _media_type(content_type: Optional[str]) -> Optional[str]:
+    if content_type is None:
+        return None
+
+    match = _CONTENT_TYPE_PATTERN.match(content_type)
+    return match[1].lower() if match is not None else None
+
+
+def _is_plain_text_content_type(content_type: Optional[str]) -> bool:
+    return _media_type(content_type) in PLAIN_TEXT_CONTENT_TYPES
+
+
+def _plain_text(text: str | bytes, target_language: str) -> Optional[str]:
+    # there is nothing to extract from plain text, but like extracted texts,
+    # it has to be in the requested language
+    if isinstance(text, bytes):
+        text = decode_file(text)
+
+    if target_language != "auto" and get_lang(text) != target_language:
+        return None
+
+    return text
+
+
+#: the texts extracted from documents, such that identical documents (e.g. from
+#: mirrors or retries) are only extracted once
+document_cache: ContentCache[str] = ContentCache(max_size=1024, num_shards=16)
+
+
+def _document_key(
+    html: str | bytes, target_language: str, preference: Preference
+) -> Hashable:
+    data = html if isinstance(html, bytes) else html.encode()
+    digest = hashlib.blake2b(data, digest_size=16).digest()
+    return digest, target_language, preference
 
 
 def from_binary_html(
-    html: Any, target_language: str = "auto", preference: Preference = "none", **kwargs
+    html: Any,
+    target_language: str = "auto",
+    preference: Preference = "none",
+    content_type: Optional[str] = None,
+    **kwargs,
+) -> Optional[str]:
+    """
+    Extract the text from the raw html.
+
+    If the ``content_type`` of the document is known to be plain text (e.g.
+    from the ``Content-Type`` header), the document is returned as-is, as long
+    as it is in the ``target_language``.
+    """
+    if isinstance(html, (str, bytes)) and _is_plain_text_content_type(content_type):
+        return _plain_text(html, target_language=target_language)
+
+    # only cache documents that are given as-is, using the default settings
+    if kwargs or not isinstance(html, (str, bytes)):
+        return _extract_text(
+            html, target_language=target_language, preference=preference, **kwargs
+        )
+
+    key = _document_key(html, target_language=target_language, preference=preference)
+    fulltext = document_cache.get(key)
+    if fulltext is None:
+        fulltext = _extract_text(
+            html, target_language=target_language, preference=preference
+        )
+        if fulltext is not None:
+            document_cache.put(key, fulltext)
+
+    return fulltext
+
+
+def _extract_text(
+    html: Any, target_language: str, preference: Preference, **kwargs
 ) -> Optional[str]:
-    """Extract the text from the raw html."""
-    fulltext = trafilatura.extract(
+    try:
+        extract = _EXTRACTORS[preference]
+    except KeyError:
+        raise ValueError(f"Unknown preference {preference!r}") from None
+
+    # decode the html only once, instead of separately for the extraction and
+    # its fall-back
+    if isinstance(html, bytes):
+        html = decode_file(html)
+
+    # the extraction usually does not run in the main thread
+    kwargs.setdefault("config", _TRAFILATURA_CONFIG)
+
+    fulltext = extract(
         html,
-        favor_recall=preference == "recall",
-        favor_precision=preference == "precision",
         target_language=target_language if target_language != "auto" else None,
-        **kwargs
+        **kwargs,
     )
 
     # when trafilatura doesn't provide anything, use html2text as a fall-bock
@@ -81,6 +532,16 @@ def from_binary_html(
     return fulltext
 
 
+#: the number of characters that the language is detected from. the language
+#: is usually clear long before that
+LANG_DETECTION_LENGTH = 2048
+
+
 def get_lang(text: str) -> str:
-    lang, _ = langid.classify(text)
+    """
+    Detect the language of the text from its first ``LANG_DETECTION_LENGTH``
+    characters. For texts that mix several languages, classify the whole text
+    through ``py3langid`` directly instead.
+    """
+    lang, _ = langid.classify(text[:LANG_DETECTION_LENGTH])
     return lang
@@ -1,11 +1,19 @@
+import asyncio
+import threading
 from abc import abstractmethod
-from typing import Callable, Optional, Protocol, Type
+from collections import OrderedDict
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
+from functools import lru_cache, wraps
+from inspect import isawaitable
+from typing import Any, Callable, Optional, Protocol, Type
 from urllib.parse import urlparse
 
 from pyrate_limiter import (
     AbstractBucket,
     AbstractClock,
     BucketFactory,
+    BucketFullException,
     Duration,
     InMemoryBucket,
     Limiter,
@@ -67,16 +75,28 @@ def get_simple_weight_strategy(base_weight: int = 20) -> WeightStrategy:
 
 
 class MultiBucketFactory(BucketFactory):
+    """
+    Create one ``Bucket`` per (domain) name.
+
+    At most ``max_buckets`` buckets are kept; once there are more, the bucket
+    of the least recently accessed name is discarded. Because buckets only
+    remember the accesses of their respective rate intervals, this only
+    forgets the history of names that have not been accessed in a while.
+    """
+
     def __init__(
         self,
         clock: AbstractClock,
         rate_strategy: RateStrategy,
         weight_strategy: WeightStrategy,
+        max_buckets: int = 8192,
     ) -> None:
         self.clock = clock
         self.rate_strategy = rate_strategy
         self.weight_strategy = weight_strategy
-        self.buckets: dict[str, AbstractBucket] = dict()
+        self.max_buckets = max_buckets
+        self.buckets: OrderedDict[str, AbstractBucket] = OrderedDict()
+        self.lock = threading.Lock()
 
     def create(
         self,
@@ -101,21 +121,34 @@ class MultiBucketFactory(BucketFactory):
         )
 
     def get(self, item: RateItem) -> AbstractBucket:
-        if item.name not in self.buckets:
+        # keeping track of the order of accesses modifies the buckets on every
+        # access, so this always needs to hold the lock. this also ensures
+        # that concurrent accesses do not create (and leak) two buckets
+        with self.lock:
+            bucket = self.buckets.get(item.name)
+            if bucket is not None:
+                self.buckets.move_to_end(item.name)
+                return bucket
+
             # Use `self.create(..)` method to both initialize new bucket and calling `schedule_leak` on that bucket
             # We can create different buckets with different types/classes here as well
-            new_bucket = self.create(
+            bucket = self.create(
                 clock=self.clock,
                 bucket_class=InMemoryBucket,
                 rates=self.rate_strategy(item.name),
             )
-            self.buckets.update({item.name: new_bucket})
+            self.buckets[item.name] = bucket
 
-        return self.buckets[item.name]
+            if len(self.buckets) > self.max_buckets:
+                _, evicted = self.buckets.popitem(last=False)
+                # stop leaking the evicted bucket (requires pyrate-limiter 3.7)
+                self.dispose(evicted)
+
+        return bucket
 
 
 def get_simple_multibucket_limiter(
-    max_rate_per_second: int = 100, base_weight: int = 20
+    max_rate_per_second: int = 100, base_weight: int = 20, max_buckets: int = 8192
 ) -> Limiter:
     """
     A simple rate limiting strategy that limits accesses to five per second and
@@ -126,10 +159,154 @@ def get_simple_multibucket_limiter(
             clock=TimeClock(),
             rate_strategy=get_simple_rate_strategy(max_rate_per_second),
             weight_strategy=get_simple_weight_strategy(base_weight),
+            max_buckets=max_buckets,
         )
     )
 
 
+async def _resolve(value: Any) -> Any:
+    # pyrate-limiter's buckets may or may not be asynchronous
+    while isawaitable(value):
+        value = await value
+
+    return value
+
+
+async def _acquire(
+    limiter: Limiter, name: str, weight: int, max_delay: Optional[float]
+) -> None:
+    loop = asyncio.get_running_loop()
+    deadline = None if max_delay is None else loop.time() + max_delay
+    while True:
+        try:
+            await _resolve(limiter.try_acquire(name, weight))
+            return
+        except BucketFullException:
+            # ask the bucket when the access will fit in again
+            factory = limiter.bucket_factory
+            item = await _resolve(factory.wrap_item(name, weight))
+            bucket = await _resolve(factory.get(item))
+            # the access never fits in, if it is heavier than the limit itself
+            failing_rate = bucket.failing_rate
+            if failing_rate is not None and item.weight > failing_rate.limit:
+                raise
+            # otherwise, a negative wait means that the access already fits in
+            # again, just that the bucket has not leaked the older items yet.
+            # retry after a short moment then, instead of spinning
+            delay = max(await _resolve(bucket.waiting(item)), 1) / 1000
+            # the access does not fit in within the time we are willing to wait
+            if deadline is not None and loop.time() + delay > deadline:
+                raise
+
+            await asyncio.sleep(delay)
+
+
+def as_waiting_decorator(
+    limiter: Limiter, max_delay: Optional[float] = None
+) -> Callable[
+    [Callable[..., tuple[str, int]]],
+    Callable[[Callable[..., Any]], Callable[..., Any]],
+]:
+    """
+    Like ``limiter.as_decorator()``, but accesses that exceed the rate limits
+    wait until they fit in, instead of failing with a ``BucketFullException``.
+    The waiting does not block the event loop, so the decorated functions
+    become coroutines.
+
+    :param max_delay: The maximum number of seconds that an access may wait.
+        Accesses that would have to wait for longer fail right away.
+        If ``None``, accesses wait for as long as necessary.
+    """
+
+    def with_mapping_func(mapping: Callable[..., tuple[str, int]]):
+        def decorator_wrapper(func: Callable[..., Any]) -> Callable[..., Any]:
+            @wraps(func)
+            async def wrapper(*args, **kwargs):
+                name, weight = mapping(*args, **kwargs)
+                await _acquire(limiter, name, weight, max_delay)
+                return await _resolve(func(*args, **kwargs))
+
+            return wrapper
+
+        return decorator_wrapper
+
+    return with_mapping_func
+
+
+class DomainSemaphores:
+    """
+    Bound the number of concurrent accesses per (domain) name.
+
+    Unlike the ``Limiter``, which restricts how often a domain is accessed,
+    this restricts how many accesses to a domain may be in flight at once.
+    Accesses to different domains never wait on each other.
+
+    The semaphore of a name is discarded as soon as no access on it holds or
+    waits for it, such that only the names currently being accessed are kept.
+    """
+
+    def __init__(self, max_concurrency: int = 5) -> None:
+        self.max_concurrency = max_concurrency
+        self.semaphores: dict[str, asyncio.Semaphore] = dict()
+        #: the number of accesses that hold or wait for each semaphore
+        self.users: dict[str, int] = dict()
+
+    @asynccontextmanager
+    async def acquire(self, name: str) -> AsyncIterator[None]:
+        """Wait until the name may be accessed, and release it afterwards."""
+        semaphore = self.semaphores.get(name)
+        if semaphore is None:
+            semaphore = asyncio.Semaphore(self.max_concurrency)
+            self.semaphores[name] = semaphore
+            self.users[name] = 0
+
+        self.users[name] += 1
+        try:
+            async with semaphore:
+                yield
+        finally:
+            self.users[name] -= 1
+            if self.users[name] == 0:
+                del self.semaphores[name]
+                del self.users[name]
+
+    def as_decorator(
+        self,
+    ) -> Callable[
+        [Callable[..., tuple[str, int]]],
+        Callable[[Callable[..., Any]], Callable[..., Any]],
+    ]:
+        """
+        Analogous to ``Limiter.as_decorator``, return a decorator factory that
+        takes the mapping from arguments to (domain) name and weight.
+        The decorated functions become coroutines.
+        """
+
+        def with_mapping_func(mapping: Callable[..., tuple[str, int]]):
+            def decorator_wrapper(func: Callable[..., Any]) -> Callable[..., Any]:
+                @wraps(func)
+                async def wrapper(*args, **kwargs):
+                    name, _ = mapping(*args, **kwargs)
+                    async with self.acquire(name):
+                        result = func(*args, **kwargs)
+                        while isawaitable(result):
+                            result = await result
+
+                    return result
+
+                return wrapper
+
+            return decorator_wrapper
+
+        return with_mapping_func
+
+
+@lru_cache(maxsize=4096)
+def _get_hostname(url: str) -> str:
+    # the same URLs and domains are accessed repeatedly, so avoid re-parsing
+    return urlparse(url).hostname or ""
+
+
 def domain_mapper(url: str, *args, **kwargs) -> tuple[str, int]:
     """
     Return the domain name and a weight from the given URL.
@@ -138,5 +315,4 @@ def domain_mapper(url: str, *args, **kwargs) -> tuple[str, int]:
     and affects how quickly the rate limiter kicks in. Currently, this weight
     is always 1.
     """
-    url_parsed = urlparse(url)
-    return url_parsed.hostname or "", 1
+    return _get_hostname(url), 1
@@ -1,19 +1,90 @@
 #!/usr/bin/env python3
 import argparse
+import asyncio
+import logging
+from collections.abc import Hashable
+from contextlib import asynccontextmanager
 from enum import StrEnum, auto
+from functools import partial
 from typing import Optional
+from urllib.parse import urlsplit, urlunsplit
 
+import fastapi
 import uvicorn
 from fastapi import FastAPI, HTTPException, Request
-from fastapi import FastAPI
+from fastapi.middleware.gzip import GZipMiddleware
 
 from playwright import async_api
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, HttpUrl
+from pyrate_limiter import BucketFullException
 
 import text_extraction.grab_content as grab_content
 from text_extraction._version import __version__
+from text_extraction.browser_pool import BrowserPool, RemoteBrowsers
+from text_extraction.caching import ContentCache, cached
+from text_extraction.extraction_pool import ExtractionPool
+from text_extraction.rate_limiting import as_waiting_decorator, domain_mapper
+
+logger = logging.getLogger(__name__)
+
+#: the number of local browsers that render pages at the same time
+BROWSER_POOL_SIZE = 4
+#: the number of connections to remote browsers that are kept open at once
+MAX_REMOTE_BROWSERS = 16
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # start the playwright driver once, instead of on every request.
+    # likewise, share the connections of one HTTP client between all requests
+    async with (
+        async_api.async_playwright() as playwright,
+        grab_content.new_client() as http,
+    ):
+        app.state.playwright = playwright
+        app.state.http = http
+        # as well as the processes that extract large documents
+        app.state.extraction_pool = ExtractionPool()
+        app.state.browsers = BrowserPool(
+            partial(
+                playwright.chromium.launch,
+                args=[
+                    # HACK: for some reason, passing this avoids an issue where
+                    # text extraction would fail when the service is run within
+                    # Docker, due to a page crash
+                    "--single-process"
+                ],
+            ),
+            size=BROWSER_POOL_SIZE,
+            recycle_after=100,
+        )
+        # connections to remote browsers, by their cdp locations
+        app.state.remote_browsers = RemoteBrowsers(
+            lambda location: playwright.chromium.connect_over_cdp(
+                endpoint_url=location
+            ),
+            max_size=MAX_REMOTE_BROWSERS,
+        )
+        yield
+        await app.state.browsers.close()
+        await app.state.remote_browsers.close()
+        await app.state.extraction_pool.aclose()
+
+
+#: the major and minor version of the installed FastAPI
+FASTAPI_VERSION = tuple(int(part) for part in fastapi.__version__.split(".")[:2])
 
-app = FastAPI()
+# extracted texts can be large, so serialize them with the faster orjson.
+# since 0.130, FastAPI serializes responses with declared types through
+# pydantic directly, which is faster still, and deprecates ORJSONResponse
+if FASTAPI_VERSION < (0, 130):
+    from fastapi.responses import ORJSONResponse
+
+    app = FastAPI(lifespan=lifespan, default_response_class=ORJSONResponse)
+else:
+    app = FastAPI(lifespan=lifespan)
+# and compress them, as they tend to consist of highly redundant natural text
+app.add_middleware(GZipMiddleware, minimum_size=1024, compresslevel=5)
 
 
 class Methods(StrEnum):
@@ -21,20 +92,36 @@ class Methods(StrEnum):
     browser = auto()
 
 
-class Data(BaseModel):
-    url: str
+class Options(BaseModel):
     method: Methods = Methods.simple
     browser_location: Optional[str] = Field(default=None, examples=[None])
     lang: str = "auto"
     preference: grab_content.Preference = "none"
 
 
+class Data(Options):
+    url: HttpUrl
+
+
 class Result(BaseModel):
     text: str
     lang: str
     version: str = __version__
 
 
+#: the number of URLs that a single batch may contain at most
+MAX_BATCH_SIZE = 100
+
+
+class BatchData(Options):
+    urls: list[HttpUrl] = Field(max_length=MAX_BATCH_SIZE)
+
+
+class Failure(BaseModel):
+    status_code: int
+    detail: str
+
+
 @app.get("/_ping")
 async def _ping():
     pass
@@ -60,6 +147,7 @@ summary = "Extract text from a given URL"
     preference : str, optional
         Whether to prioritize precision, recall, or neither
         when extracting the text.
+        'none' skips trafilatura's slower fall-back algorithms.
         Default: 'none'
     method : "simple" or "browser"
         Whether to get the content of the website naively, or to use a headless
@@ -78,49 +166,149 @@ summary = "Extract text from a given URL"
 )
 async def from_url(request: Request, data: Data) -> Result:
     """Extract text from a given URL"""
+    url = normalize_url(str(data.url), data.method)
+    return await extract(request.app, url, data)
+
+
+#: query parameters that only track where visitors came from
+TRACKING_PARAMETERS = frozenset({"gclid", "fbclid"})
+
+
+def _parameter_key(parameter: str) -> str:
+    key, _, _ = parameter.partition("=")
+    return key
+
+
+def _is_tracking_parameter(parameter: str) -> bool:
+    key = _parameter_key(parameter)
+    return key.startswith("utm_") or key in TRACKING_PARAMETERS
+
+
+def normalize_url(url: str, method: Methods) -> str:
+    """
+    Normalize the URL, such that its variants that lead to the same content
+    share their cache entries.
+
+    Scheme and host are lowercased, tracking parameters removed, and the
+    remaining query parameters sorted by their keys. The fragment is never
+    sent to the server, so it is dropped, unless a headless browser is used,
+    where it may determine what the page's JavaScript displays.
+
+    As the normalized URL is also the one that is downloaded, the query
+    parameters are otherwise kept exactly as given, including their encoding
+    and the order of the values of repeated keys.
+    """
+    parts = urlsplit(url)
+    # the user information, if any, is case-sensitive
+    user_info, at, host = parts.netloc.rpartition("@")
+    parameters = [
+        parameter
+        for parameter in parts.query.split("&")
+        if parameter and not _is_tracking_parameter(parameter)
+    ]
+    # sorting is stable, so the values of repeated keys keep their order
+    parameters.sort(key=_parameter_key)
+    fragment = parts.fragment if method == Methods.browser else ""
+
+    return urlunsplit(
+        (
+            parts.scheme.lower(),
+            user_info + at + host.lower(),
+            parts.path,
+            "&".join(parameters),
+            fragment,
+        )
+    )
 
-    lang = data.lang
 
-    # the simple method is, as its name suggest, pretty simple to use
-    if data.method == Methods.simple:
-        text = grab_content.from_html(
-            data.url,
-            preference=data.preference,
-            target_language=lang,
-        )
+def request_mapper(
+    app: FastAPI, url: str, options: Options, *args, **kwargs
+) -> Hashable:
+    """Map the request to the options that determine its result."""
+    return (
+        url,
+        options.method,
+        options.browser_location,
+        options.lang,
+        options.preference,
+    )
 
-    # using a headless browser requires us to specify the browser to use.
-    # if no cdp location was given, just start up a new one.
-    else:
-        if data.browser_location is None:
 
-            get_browser_fun = lambda x: x.chromium.launch(
-                args=[
-                    # HACK: for some reason, passing this avoids an issue where
-                    # text extraction would fail when the service is run within
-                    # Docker, due to a page crash
-                    "--single-process"
-                ]
-            )
-        else:
-            get_browser_fun = lambda x: x.chromium.connect_over_cdp(
-                endpoint_url=data.browser_location
-            )
-        async with (
-            async_api.async_playwright() as p,
-            # close (the connection to) the browser after we are done
-            await get_browser_fun(p) as browser,
-        ):
-            text = await grab_content.from_headless_browser(
-                data.url,
-                browser=browser,
-                preference=data.preference,
-                target_language=lang,
-            )
+#: the results of recent requests, such that repeating them skips the
+#: extraction entirely. Results expire, as the websites may change.
+result_cache: ContentCache[Result] = ContentCache(max_size=1000, ttl=600.0)
+#: the failures of recent requests. These expire sooner, as they are more
+#: likely to be temporary.
+failure_cache: ContentCache[Failure] = ContentCache(max_size=1000, ttl=30.0)
+
+#: the number of seconds after which an extraction is aborted
+EXTRACTION_TIMEOUT = 30.0
+#: the number of seconds that an extraction waits for the rate limits of its
+#: domain at most. extractions that would have to wait for longer fail right
+#: away, instead of running into EXTRACTION_TIMEOUT
+RATE_LIMIT_DELAY = 10.0
+
+# share the per-domain rate limits with the library, but wait for less time
+service_limiter = as_waiting_decorator(
+    grab_content.rate_limiter, max_delay=RATE_LIMIT_DELAY
+)(domain_mapper)
+from_html = grab_content.concurrency_limiter(
+    service_limiter(grab_content.from_html_unlimited)
+)
+from_headless_browser = grab_content.concurrency_limiter(
+    service_limiter(grab_content.from_headless_browser_unlimited)
+)
+
+
+@cached(result_cache, request_mapper)
+async def extract(app: FastAPI, url: str, options: Options) -> Result:
+    """
+    Extract text from the given URL, raising an ``HTTPException`` if
+    no text could be extracted.
+
+    Both results and failures are cached.
+    """
+    key = request_mapper(app, url, options)
+    failure = failure_cache.get(key)
+    if failure is not None:
+        raise HTTPException(status_code=failure.status_code, detail=failure.detail)
+
+    try:
+        return await extract_uncached(app, url, options)
+    except HTTPException as e:
+        failure_cache.put(key, Failure(status_code=e.status_code, detail=e.detail))
+        raise
+
+
+async def extract_uncached(app: FastAPI, url: str, options: Options) -> Result:
+    """See ``extract``."""
+    lang = options.lang
+
+    # do not let slow websites or hanging browsers tie up our resources
+    try:
+        async with asyncio.timeout(EXTRACTION_TIMEOUT):
+            text = await grab_text(app, url, options)
+    except TimeoutError:
+        raise HTTPException(
+            status_code=504,
+            detail=f"The extraction did not finish within {EXTRACTION_TIMEOUT} seconds.",
+        )
+    # the domain has been accessed too often, even after waiting for a while
+    except BucketFullException:
+        raise HTTPException(
+            status_code=429,
+            detail="Too many requests to this domain. Try again later.",
+        )
+    # the document is not a web page (e.g. a PDF or an image)
+    except grab_content.UnsupportedMediaTypeError as e:
+        raise HTTPException(
+            status_code=415,
+            detail=f"The URL points to a document of type {e.media_type}, which text can not be extracted from.",
+        )
 
     # no content could be grabbed -> raise an exception
     if text is None:
-        if data.lang is None:
+        if options.lang is None:
             language_line = "or because the language was not succesfully detected. Try setting the lang parameter."
         else:
             language_line = f"or because the text is not of language '{lang}'."
@@ -135,6 +323,94 @@ async def from_url(request: Request, data: Data) -> Result:
     return Result(text=text, lang=lang)
 
 
+async def grab_text(app: FastAPI, url: str, options: Options) -> Optional[str]:
+    """Grab the text from the given URL, using the method given in options."""
+    # the simple method is, as its name suggest, pretty simple to use.
+    # the results are cached by extract already, so do not cache the texts again
+    if options.method == Methods.simple:
+        return await from_html(
+            url,
+            preference=options.preference,
+            target_language=options.lang,
+            client=app.state.http,
+            pool=app.state.extraction_pool,
+        )
+
+    # using a headless browser requires us to specify the browser to use.
+    # if no cdp location was given, use one of those shared by all requests.
+    # the browser is only borrowed once the rate limits allow the access
+    else:
+        browser_factory: grab_content.BrowserFactory
+        if options.browser_location is None:
+            # borrow one of the shared browsers, keeping it open after we are done
+            browser_factory = app.state.browsers.browser
+        else:
+            # keep the connection to the browser open for later requests
+            browser_factory = partial(
+                app.state.remote_browsers.browser, options.browser_location
+            )
+        return await from_headless_browser(
+            url,
+            browser=browser_factory,
+            preference=options.preference,
+            target_language=options.lang,
+            client=app.state.http,
+            pool=app.state.extraction_pool,
+        )
+
+
+batch_summary = "Extract text from multiple given URLs"
+
+#: the number of URLs of a batch that are processed at once
+BATCH_CONCURRENCY = 32
+
+
+@app.post(
+    "/from-urls",
+    summary=batch_summary,
+    description=f"""
+    {batch_summary}
+
+    The URLs are processed concurrently, subject to the same per-domain rate
+    limits as individual requests.
+
+    Parameters
+    ---------
+    urls : list of str
+        The URLs from which to extract text, at most {MAX_BATCH_SIZE}.
+        Larger batches are rejected and need to be split up.
+    lang, preference, method
+        See /from-url. These apply to all of the given URLs.
+
+    Returns
+    -------
+    A list with one entry per given URL, in the same order. Each entry is
+    either the result of /from-url, or, if extraction failed, an object with
+    status_code : int
+        The HTTP status code that /from-url would have responded with.
+    detail : str
+        A description of why the extraction failed.
+    """,
+)
+async def from_urls(request: Request, data: BatchData) -> list[Result | Failure]:
+    """Extract text from multiple given URLs"""
+    semaphore = asyncio.Semaphore(BATCH_CONCURRENCY)
+
+    async def from_single_url(url: HttpUrl) -> Result | Failure:
+        async with semaphore:
+            try:
+                normalized_url = normalize_url(str(url), data.method)
+                return await extract(request.app, normalized_url, data)
+            except HTTPException as e:
+                return Failure(status_code=e.status_code, detail=e.detail)
+            # do not let a single URL fail the entire batch
+            except Exception:
+                logger.exception("Extracting text from %s failed", url)
+                return Failure(status_code=500, detail="Internal Server Error")
+
+    return await asyncio.gather(*map(from_single_url, data.urls))
+
+
 def main():
     # define CLI arguments
     parser = argparse.ArgumentParser()
@@ -144,6 +420,25 @@ def main():
     parser.add_argument(
         "--host", action="store", default="0.0.0.0", help="Hosts to listen on", type=str
     )
+    parser.add_argument(
+        "--uds",
+        action="store",
+        default=None,
+        help="Unix domain socket to listen on, instead of the host and port",
+        type=str,
+    )
+    parser.add_argument(
+        "--workers",
+        action="store",
+        default=1,
+        help="Number of worker processes",
+        type=int,
+    )
+    parser.add_argument(
+        "--access-log",
+        action="store_true",
+        help="Log every request that is answered",
+    )
     parser.add_argument(
         "--lang",
         action="store",
@@ -161,8 +456,23 @@ def main():
     # read passed CLI arguments
     args = parser.parse_args()
 
-    # create and run the web service
-    uvicorn.run(app, host=args.host, port=args.port, reload=False)
+    # create and run the web service.
+    # explicitly require the faster event loop and HTTP parser, such that we
+    # do not silently fall back to the pure Python implementations
+    uvicorn.run(
+        # each of multiple workers needs to import the app on its own
+        "text_extraction.webservice:app" if args.workers > 1 else app,
+        host=args.host,
+        port=args.port,
+        uds=args.uds,
+        workers=args.workers,
+        # formatting and writing a line per request is not free, so only do
+        # it when asked to. errors are still logged
+        access_log=args.access_log,
+        reload=False,
+        loop="uvloop",
+        http="httptools",
+    )
 
 
 if __name__ == "__main__":